@@ -11,6 +11,8 @@ import streamlit as st
 
 from config import MODEL
 from chat_controller import (
+    ROLE_ASSISTANT,
+    ROLE_USER,
     chat_turn,
     ensure_session_state,
     initialize_chat,
@@ -101,47 +103,55 @@ if btn_interviewer or btn_candidate:
 st.divider()
 st.subheader("Chat (Multi-Turn)")
 
-if not st.session_state.initialized:
-    st.info(
-        "Upload CV + Job Description and click one of the Start buttons "
-        "to initialize the chat context."
-    )
-else:
+# Runs as a fragment: submitting a chat message reruns only this panel,
+# not the sidebar, upload widgets and buttons above it.
+@st.fragment
+def chat_panel(settings: UiSettings) -> None:
     # IMPORTANT: Use locked output format for the whole session to ensure consistency and safety
     locked_format = st.session_state.output_format
     st.info(f"Locked output format for this chat: {locked_format}")
 
     # Render history once
-    for m in st.session_state.messages:   # m = message
-        with st.chat_message(m["role"]):
-            if m["role"] == "assistant":
-                render_assistant_output(m["content"], locked_format)
+    for role, content in zip(st.session_state.roles, st.session_state.contents):
+        with st.chat_message(role):
+            if role == ROLE_ASSISTANT:
+                render_assistant_output(content, locked_format)
             else:
-                st.markdown(m["content"])
+                st.markdown(content)
 
     # Chat input
     user_msg = st.chat_input("Ask a follow up question.")
     if user_msg:
-        with st.chat_message("user"):
+        with st.chat_message(ROLE_USER):
             st.markdown(user_msg)   # Display user message in chat
 
-        with st.spinner("Thinking..."):
-            try:
-                assistant_text = chat_turn(   # Process a chat turn: new user message + previous chat history + system prompt + parameters  
-                    user_input=user_msg,
-                    output_format=locked_format,  # IMPORTANT: locked
-                    model=settings.model,
-                    system_prompt=SYSTEM_PROMPT,
-                    temperature=settings.temperature,
-                    max_tokens=settings.max_tokens,
-                    top_p=settings.top_p,
-                    frequency_penalty=settings.frequency_penalty,
-                    presence_penalty=settings.presence_penalty,
-                )
-            except Exception as exc:   
-                st.error(f"API error: {exc}")
-                st.stop()
-
-        with st.chat_message("assistant"):   
-            render_assistant_output(assistant_text, locked_format)   # Show new response
+        # Process a chat turn: new user message + previous chat history + system prompt + parameters
+        turn_args = dict(
+            user_input=user_msg,
+            output_format=locked_format,  # IMPORTANT: locked
+            model=settings.model,
+            system_prompt=SYSTEM_PROMPT,
+            temperature=settings.temperature,
+            max_tokens=settings.max_tokens,
+            top_p=settings.top_p,
+            frequency_penalty=settings.frequency_penalty,
+            presence_penalty=settings.presence_penalty,
+        )
+        try:
+            with st.chat_message(ROLE_ASSISTANT):
+                # Plain text is streamed token by token; JSON (JSON mode) is
+                # requested in one piece and parsed once complete
+                with st.spinner("Thinking..."):
+                    response = chat_turn(**turn_args, stream=locked_format == "Text")
+                render_assistant_output(response, locked_format)   # Show new response
+        except Exception as exc:
+            st.error(f"API error: {exc}")
+
 
+if not st.session_state.initialized:
+    st.info(
+        "Upload CV + Job Description and click one of the Start buttons "
+        "to initialize the chat context."
+    )
+else:
+    chat_panel(settings)
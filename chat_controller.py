@@ -6,20 +6,49 @@
 # - Initialize chat context and handle user turns.
 # """
 
-from typing import Optional, Tuple
+import functools
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple, Union
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-from config import get_openai_api_key
+from config import RETRIEVAL_TOP_K, get_openai_api_key
 from extraction import extract_text
-from openai_client import call_openai
+from openai_client import call_openai, stream_openai
 from prompts_formats import (
     FORMAT_JSON_A,
+    FORMAT_JSON_AB,
     FORMAT_JSON_B,
+    build_chat_prompt,
+    build_context_block,
     build_perspective_text,
-    build_user_prompt,
+    build_starter_prompt,
 )
-from security import MAX_CHARS, matches_blocklist
+from retrieval import (
+    FragmentIndex,
+    build_fragment_index,
+    retrieve_context,
+    split_fragments,
+)
+from security import MAX_CHARS, MAX_UPLOAD_BYTES, matches_blocklist
+
+# Number of most recent messages included in the prompt history block
+HISTORY_WINDOW = 8
+# Number of messages kept in session state (and rendered) per chat
+MAX_MESSAGES = 40
+
+# Chat roles and their pre-uppercased labels for the prompt history block
+ROLE_USER = "user"
+ROLE_ASSISTANT = "assistant"
+_ROLE_LABELS = {ROLE_USER: "USER", ROLE_ASSISTANT: "ASSISTANT"}
+
+# Response token floor for JSON_AB: summaries, matches/gaps and 10 questions
+# with answers do not fit the sidebar default, and truncated JSON is unusable.
+MIN_TOKENS_JSON_AB = 2400
 
 
 # -----------------------------
@@ -28,59 +57,170 @@ from security import MAX_CHARS, matches_blocklist
 def ensure_session_state() -> None:
     """Ensure all required session state variables are initialized before the app
     uses them."""
-    st.session_state.setdefault("messages", [])
+    # Chat history as parallel lists (structure of arrays): roles[i], contents[i]
+    st.session_state.setdefault("roles", [])
+    st.session_state.setdefault("contents", [])
+    # Pre-formatted "ROLE: content" lines of the most recent messages
+    st.session_state.setdefault("recent_formatted", deque(maxlen=HISTORY_WINDOW))
     st.session_state.setdefault("cv_text", "")
     st.session_state.setdefault("jd_text", "")
     st.session_state.setdefault("perspective_mode", "candidate")
     st.session_state.setdefault("initialized", False)
     # Lock output format per chat session
     st.session_state.setdefault("output_format", "Text")
+    st.session_state.setdefault("prompt_cache_key", "")
+    # CV/JD context block, built once per chat session
+    st.session_state.setdefault("context_block", "")
+    st.session_state.setdefault("fragment_index", None)
 
 
 def reset_state() -> None:
     """Clear all chat-related session data to start a new conversation with a
     clean state."""
-    st.session_state.messages = []
+    st.session_state.roles = []
+    st.session_state.contents = []
+    st.session_state.recent_formatted = deque(maxlen=HISTORY_WINDOW)
     st.session_state.cv_text = ""
     st.session_state.jd_text = ""
     st.session_state.perspective_mode = "candidate"
     st.session_state.initialized = False
     # Resets the output format set per session.
     st.session_state.output_format = "Text"
+    st.session_state.prompt_cache_key = ""
+    st.session_state.context_block = ""
+    st.session_state.fragment_index = None
+
+
+def _append_message(role: str, content: str) -> None:
+    """Append a message to the chat history and to the recent-history window.
+
+    The history is capped at MAX_MESSAGES so memory use and per-rerun render
+    cost stay bounded in long sessions.
+    """
+    roles = st.session_state.roles
+    contents = st.session_state.contents
+    roles.append(role)
+    contents.append(content)
+    if len(roles) > MAX_MESSAGES:
+        del roles[:-MAX_MESSAGES]
+        del contents[:-MAX_MESSAGES]
+    st.session_state.recent_formatted.append(f"{_ROLE_LABELS[role]}: {content}")
 
 
 # -----------------------------
 # Output format instructions
 # -----------------------------
+@functools.lru_cache(maxsize=8)
 def _format_instruction(output_format: str) -> str:
     """Adds explicit instructions to the prompt that tell the LLM whether to respond
-    in JSON_A, JSON_B, or plain text."""
+    in JSON_A, JSON_B, JSON_AB, or plain text."""
     if output_format == "JSON_A":
         return FORMAT_JSON_A
     if output_format == "JSON_B":
         return FORMAT_JSON_B
+    if output_format == "JSON_AB":
+        return FORMAT_JSON_AB
     return "Return normal text (not JSON)."
 
 
-def _effective_system_prompt(system_prompt: str, output_format: str) -> str:
-    """Dynamically augments the system prompt when a JSON output format is selected
-    to enforce strict JSON-only responses and prevent extra text or formatting.
+def _effective_max_tokens(output_format: str, max_tokens: int) -> int:
+    """Raise the response token cap to MIN_TOKENS_JSON_AB for JSON_AB."""
+    if output_format == "JSON_AB":
+        return max(max_tokens, MIN_TOKENS_JSON_AB)
+    return max_tokens
+
+
+def _session_system_prompt(system_prompt: str, output_format: str) -> str:
+    """Build the system message used for every call of a chat session.
+
+    The format instruction lives here (not in the user message) so that the
+    system message plus the CV/JD context form an identical prompt prefix for
+    the start call and all follow-up turns. JSON formats carry no extra
+    "JSON only" rules: JSON mode (response_format) already enforces that.
     """
-    if output_format.startswith("JSON"):
-        return (
-            system_prompt
-            + "\n\nIMPORTANT OUTPUT RULE:\n"
-            + "If the user requested JSON, you MUST output ONLY valid JSON.\n"
-            + "Do not output markdown, headings, backticks, code fences, "
-            + "or extra text.\n"
-            + "If a value is unknown, use an empty string or empty list.\n"
-        )
-    return system_prompt
+    return system_prompt + "\n\n" + _format_instruction(output_format)
+
+
+def _prompt_cache_key(cv_text: str, jd_text: str) -> str:
+    """Derive a stable prompt cache key from the session's CV/JD context."""
+    digest = hashlib.sha256()
+    digest.update(cv_text.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(jd_text.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+# -----------------------------
+# File extraction
+# -----------------------------
+def _extract_both(cv_file, jd_file) -> Tuple[str, str]:
+    """Extract CV and JD text concurrently.
+
+    Worker threads are attached to the current script run context so that
+    Streamlit calls inside extract_text (cache, warnings) keep working.
+    """
+    ctx = get_script_run_ctx()
+
+    def _extract(uploaded) -> str:
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return extract_text(uploaded)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fut_cv = executor.submit(_extract, cv_file)
+        fut_jd = executor.submit(_extract, jd_file)
+        return fut_cv.result(), fut_jd.result()
+
+
+# -----------------------------
+# CV/JD retrieval
+# -----------------------------
+def _build_index(cv_text: str, jd_text: str) -> Optional[FragmentIndex]:
+    """Embed CV/JD fragments once per session for per-turn retrieval.
+
+    Returns None when the documents already fit into RETRIEVAL_TOP_K fragments
+    (the full text is sent then) or when embeddings are unavailable.
+    """
+    n_fragments = len(split_fragments(cv_text)) + len(split_fragments(jd_text))
+    if n_fragments <= RETRIEVAL_TOP_K:
+        return None
+    try:
+        return build_fragment_index(get_openai_api_key(), cv_text, jd_text)
+    except Exception:
+        return None
+
+
+def _turn_context(user_input: str) -> str:
+    """Return the CV/JD context block to include for a chat turn.
+
+    Uses the fragments most relevant to the user message when a fragment
+    index exists, and falls back to the session's full context block
+    otherwise.
+    """
+    index = st.session_state.fragment_index
+    if index is not None:
+        try:
+            cv_excerpt, jd_excerpt = retrieve_context(
+                get_openai_api_key(), index, user_input, RETRIEVAL_TOP_K
+            )
+            return build_context_block(cv_excerpt, jd_excerpt, MAX_CHARS)
+        except Exception:
+            pass
+    return st.session_state.context_block
 
 
 # -----------------------------
 # LLM call (OpenAI)
 # -----------------------------
+def _require_api_key() -> str:
+    """Return the OpenAI API key or raise if it is not configured."""
+    api_key = get_openai_api_key()
+    if not api_key:
+        raise RuntimeError(
+            "OPENAI_API_KEY missing. Set it in .env or Streamlit secrets."
+        )
+    return api_key
+
+
 def _call_model(
     model: str,
     system_prompt: str,
@@ -91,7 +231,9 @@ def _call_model(
     frequency_penalty: float,
     presence_penalty: float,
     force_json: bool = False,
-) -> str:
+    prompt_cache_key: Optional[str] = None,
+    stream: bool = False,
+) -> Union[str, Iterator[str]]:
     """Central, encapsulated helper that collects all required LLM parameters,
         validates the presence of the API key, and forwards the request to the
         OpenAI client wrapper to retrieve the model response.
@@ -106,18 +248,15 @@ def _call_model(
         frequency_penalty: Frequency penalty.
         presence_penalty: Presence penalty.
         force_json: If True, request JSON output format.
+        prompt_cache_key: Optional prompt cache routing key.
+        stream: If True, return an iterator over response chunks instead.
 
     Returns:
-        Assistant text response.
+        Assistant text response, or an iterator of text chunks if stream is True.
     """
-    api_key = get_openai_api_key()
-    if not api_key:
-        raise RuntimeError(
-            "OPENAI_API_KEY missing. Set it in .env or Streamlit secrets."
-        )
-
-    return call_openai(
-        api_key=api_key,
+    call = stream_openai if stream else call_openai
+    return call(
+        api_key=_require_api_key(),
         model=model,
         system_prompt=system_prompt,
         user_prompt=user_prompt,
@@ -127,6 +266,7 @@ def _call_model(
         frequency_penalty=frequency_penalty,
         presence_penalty=presence_penalty,
         force_json=force_json,
+        prompt_cache_key=prompt_cache_key,
     )
 
 
@@ -158,7 +298,7 @@ def initialize_chat(
         cv_file: Uploaded CV file.
         jd_file: Uploaded JD file.
         is_interviewer: Perspective flag (True for interviewer mode).
-        output_format: "Text" | "JSON_A" | "JSON_B".
+        output_format: "Text" | "JSON_A" | "JSON_B" | "JSON_AB".
         model: Model name to use.
         system_prompt: Global system prompt to apply.
         temperature: Sampling temperature.
@@ -172,9 +312,17 @@ def initialize_chat(
     """
     if not cv_file or not jd_file:
         return False, "Please upload both CV and Job Description."
+    # Reject oversized uploads before reading or parsing them.
+    if any(getattr(f, "size", 0) > MAX_UPLOAD_BYTES for f in (cv_file, jd_file)):
+        return False, (
+            f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+        )
 
-    cv_text = extract_text(cv_file)
-    jd_text = extract_text(jd_file)
+    cv_text, jd_text = _extract_both(cv_file, jd_file)
+    # Truncate before validation: text past MAX_CHARS never reaches the model,
+    # so there is no need to scan it.
+    cv_text = cv_text[:MAX_CHARS]
+    jd_text = jd_text[:MAX_CHARS]
 
     if len(cv_text) < 20 or len(jd_text) < 20:
         return False, (
@@ -184,86 +332,74 @@ def initialize_chat(
     if matches_blocklist(cv_text) or matches_blocklist(jd_text):
         return False, "Blocked content detected (e.g., ignore previous instructions; potential prompt-injection)."
 
-    st.session_state.cv_text = cv_text[:MAX_CHARS]
-    st.session_state.jd_text = jd_text[:MAX_CHARS]
+    st.session_state.cv_text = cv_text
+    st.session_state.jd_text = jd_text
     st.session_state.perspective_mode = (
         "interviewer" if is_interviewer else "candidate"
     )
-    st.session_state.messages = []
+    st.session_state.roles = []
+    st.session_state.contents = []
+    st.session_state.recent_formatted = deque(maxlen=HISTORY_WINDOW)
     st.session_state.initialized = True
+    st.session_state.prompt_cache_key = _prompt_cache_key(
+        st.session_state.cv_text, st.session_state.jd_text
+    )
+    st.session_state.fragment_index = _build_index(
+        st.session_state.cv_text, st.session_state.jd_text
+    )
 
     # Lock the chosen output format for this chat session
     st.session_state.output_format = output_format
 
-    fmt_instr = _format_instruction(output_format)
     perspective_text = build_perspective_text(is_interviewer=is_interviewer)
-    effective_system = _effective_system_prompt(system_prompt, output_format)
+    session_system = _session_system_prompt(system_prompt, output_format)
 
     effective_temperature = 0.0 if output_format.startswith("JSON") else temperature
 
-    if output_format == "JSON_A":
-        json_a_task = (
-            "Task:\n"
-            "1) Summarize the CV in up to 150 words.\n"
-            "2) Summarize the Job Description in up to 150 words.\n"
-            "3) List top 5 matches and top 5 gaps.\n"
-            "Do NOT add any other sections.\n\n"
-            "=== CV ===\n"
-            f"{st.session_state.cv_text}\n\n"
-            "=== JOB DESCRIPTION ===\n"
-            f"{st.session_state.jd_text}\n"
-        )
-        starter_prompt = f"{fmt_instr}\n\n{json_a_task}"
-
-    elif output_format == "JSON_B":
-        json_b_task = (
-            "Task:\n"
-            "Generate 10 tailored interview questions (mix behavioral + "
-            "technical) based on CV and JD.\n"
-            "Provide model answers.\n"
-            "Do NOT output CV/JD summaries.\n\n"
-            "=== CV ===\n"
-            f"{st.session_state.cv_text}\n\n"
-            "=== JOB DESCRIPTION ===\n"
-            f"{st.session_state.jd_text}\n"
-        )
-        starter_prompt = (
-            f"{fmt_instr}\n\n{json_b_task}\n\nPerspective: {perspective_text}"
-        )
+    # Built once per session: the same CV/JD block is reused verbatim by every
+    # turn, which keeps the prompt prefix byte-identical.
+    context_block = build_context_block(
+        cv_text=st.session_state.cv_text,
+        jd_text=st.session_state.jd_text,
+        max_chars=MAX_CHARS,
+    )
+    st.session_state.context_block = context_block
 
-    else:
-        step4 = (
-            "4) Generate 10 tailored interview questions (behavioral + "
-            "technical) and provide answers."
-        )
-        base_prompt = build_user_prompt(
-            cv_text=st.session_state.cv_text,
-            jd_text=st.session_state.jd_text,
-            step4=step4,
-            perspective_text=perspective_text,
-            max_chars=MAX_CHARS,
-        )
-        starter_prompt = f"{fmt_instr}\n\n{base_prompt}"
+    starter_prompt = build_starter_prompt(
+        output_format=output_format,
+        context_block=context_block,
+        perspective_text=perspective_text,
+    )
 
     resp = _call_model(
         model=model,
-        system_prompt=effective_system,
+        system_prompt=session_system,
         user_prompt=starter_prompt,
         temperature=effective_temperature,
-        max_tokens=max_tokens,
+        max_tokens=_effective_max_tokens(output_format, max_tokens),
         top_p=top_p,
         frequency_penalty=frequency_penalty,
         presence_penalty=presence_penalty,
         force_json=output_format.startswith("JSON"),
+        prompt_cache_key=st.session_state.prompt_cache_key,
     )
 
-    st.session_state.messages.append({"role": "assistant", "content": resp})
+    _append_message(ROLE_ASSISTANT, resp)
     return True, None
 
 
 # -----------------------------
 # Continue / Multi-turn chatbot
 # -----------------------------
+def _persist_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Pass streamed chunks through and store the full response once complete."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    _append_message(ROLE_ASSISTANT, "".join(parts))
+
+
 def chat_turn(
     user_input: str,
     output_format: str,
@@ -274,7 +410,8 @@ def chat_turn(
     top_p: float,
     frequency_penalty: float,
     presence_penalty: float,
-) -> str:
+    stream: bool = False,
+) -> Union[str, Iterator[str]]:
     """Process a single follow-up message: validate input, append it to the session-based
     chat history, rebuild a prompt including CV/JD context, perspective, recent history,
     and the new message, call the LLM, and store the assistant response to enable
@@ -282,7 +419,7 @@ def chat_turn(
 
     Args:
         user_input: New user message to process.
-        output_format: "Text" | "JSON_A" | "JSON_B".
+        output_format: "Text" | "JSON_A" | "JSON_B" | "JSON_AB".
         model: Model name to use.
         system_prompt: Global system prompt to apply.
         temperature: Sampling temperature.
@@ -290,61 +427,58 @@ def chat_turn(
         top_p: Nucleus sampling parameter.
         frequency_penalty: Frequency penalty.
         presence_penalty: Presence penalty.
+        stream: If True, return an iterator over response chunks; the full
+            response is stored in the history once the iterator is exhausted.
 
     Returns:
-        Assistant text response.
+        Assistant text response, or an iterator of text chunks if stream is True.
     """
     if matches_blocklist(user_input):
         raise RuntimeError(
             "Blocked content detected (potential prompt-injection)."
         )
 
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    _append_message(ROLE_USER, user_input)
 
-    fmt_instr = _format_instruction(output_format)
     is_interviewer = st.session_state.perspective_mode == "interviewer"
     perspective_text = build_perspective_text(is_interviewer=is_interviewer)
 
     # Keep only the most recent messages to preserve context while staying within token limits
-    history = st.session_state.messages[-8:]
-    history_block = "\n".join(
-        [f'{m["role"].upper()}: {m["content"]}' for m in history]
-    )
+    history_block = "\n".join(st.session_state.recent_formatted)
 
-    base = build_user_prompt(
-        cv_text=st.session_state.cv_text,
-        jd_text=st.session_state.jd_text,
-        step4=(
-            "4) Continue the interview practice based on the new user "
-            "message."
-        ),
+    # CV/JD context (only the fragments relevant to this message when the
+    # documents are large) + task instructions, then the per-turn tail:
+    # recent chat history + new user message, always last.
+    prompt = build_chat_prompt(
+        context_block=_turn_context(user_input),
         perspective_text=perspective_text,
-        max_chars=MAX_CHARS,
+        history_block=history_block,
+        user_input=user_input,
     )
 
-    # Build the full user prompt: format rules + CV/JD context + recent chat history + new user message.
-    prompt = (
-        f"{fmt_instr}\n\n"
-        f"{base}\n\n"
-        "=== CHAT HISTORY (most recent) ===\n"
-        f"{history_block}\n\n"
-        "=== NEW USER MESSAGE ===\n"
-        f"{user_input}\n"
-    )
+    # With retrieval the CV/JD context differs per turn, so there is no shared
+    # prefix to route to a prompt cache.
+    cache_key = None
+    if st.session_state.fragment_index is None:
+        cache_key = st.session_state.prompt_cache_key or None
 
     assistant = _call_model(
         model=model,
-        system_prompt=system_prompt,
+        system_prompt=_session_system_prompt(system_prompt, output_format),
         user_prompt=prompt,
         temperature=temperature,
-        max_tokens=max_tokens,
+        max_tokens=_effective_max_tokens(output_format, max_tokens),
         top_p=top_p,
         frequency_penalty=frequency_penalty,
         presence_penalty=presence_penalty,
         force_json=output_format.startswith("JSON"),
+        prompt_cache_key=cache_key,
+        stream=stream,
     )
+    if stream:
+        return _persist_stream(assistant)
 
     # Persist user/assistant messages in session state to enable a true multi-turn chat experience.
-    st.session_state.messages.append({"role": "assistant", "content": assistant})
+    _append_message(ROLE_ASSISTANT, assistant)
     return assistant
 
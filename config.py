@@ -10,6 +10,9 @@ import os
 import streamlit as st
 from dotenv import load_dotenv
 
+# Load .env once at import (not on every key lookup)
+load_dotenv()
+
 # ==============================================
 # Configuration
 # - Model defaults and allowed models
@@ -19,8 +22,17 @@ from dotenv import load_dotenv
 # Single model per requirements
 MODEL = "gpt-4o-mini"
 
-def get_openai_api_key() -> str:
-    load_dotenv()
+# Embedding model and number of CV/JD fragments retrieved per chat turn
+EMBEDDING_MODEL = "text-embedding-3-small"
+RETRIEVAL_TOP_K = 8
+
+# Cached once found: the key does not change while the server runs, so
+# Streamlit reruns skip the environment/secrets lookup. A missing key is not
+# cached, so setting it later takes effect without a restart.
+_api_key = ""
+
+
+def _lookup_openai_api_key() -> str:
     key = os.getenv("OPENAI_API_KEY", "")
     if key:
         return key
@@ -28,4 +40,13 @@ def get_openai_api_key() -> str:
         return st.secrets["OPENAI_API_KEY"]
     if "openai" in st.secrets and "api_key" in st.secrets["openai"]:
         return st.secrets["openai"]["api_key"]
-    return ""
\ No newline at end of file
+    return ""
+
+
+def get_openai_api_key() -> str:
+    global _api_key
+    if not _api_key:
+        # Re-read .env only while the key is missing (it may have been added).
+        load_dotenv()
+        _api_key = _lookup_openai_api_key()
+    return _api_key
@@ -1,6 +1,17 @@
+import hashlib
 import io
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Iterable, Iterator, List
+
 import streamlit as st
 
+from security import MAX_CHARS
+
 # Optional DOCX support
 # Tries to load the python-docx dependency to enable DOCX file extraction.
 # If the library is not installed, DOCX support is gracefully disabled
@@ -12,6 +23,16 @@ except Exception:
     docx = None
     HAS_DOCX = False
 
+# Optional PDFium support
+# pypdfium2 (native PDFium) extracts text much faster than PyPDF2.
+# If it is not installed, PDF extraction falls back to PyPDF2.
+try:
+    import pypdfium2 as pdfium
+    HAS_PDFIUM = True
+except Exception:
+    pdfium = None
+    HAS_PDFIUM = False
+
 """
 File: extraction.py
 
@@ -19,7 +40,7 @@ Responsibility:
 Extract plain text from user-uploaded CV and Job Description files.
 
 Supported formats:
-- PDF (via PyPDF2)
+- PDF (via pypdfium2, PyPDF2 as fallback)
 - DOCX (via python-docx)
 - TXT (UTF-8 decoded)
 
@@ -34,7 +55,140 @@ Design notes:
 - Enables clean separation between file I/O and application logic
 """
 
+# The first PARALLEL_PAGE_THRESHOLD pages of a PDF are read in-process. Only
+# if MAX_CHARS is not reached by then, the remaining pages are extracted in
+# parallel worker processes, in ranges of _PDF_CHUNK_PAGES pages each.
+PARALLEL_PAGE_THRESHOLD = 16
+_PDF_CHUNK_PAGES = 8
+_PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+# PDFium is not thread-safe. CV and JD are extracted on two threads and
+# Streamlit sessions run concurrently, so every in-process PDFium call holds
+# this lock. Worker processes have their own PDFium instance.
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _take_until_limit(texts: Iterable[str], parts: List[str]) -> bool:
+    # Appends page/paragraph texts to parts and stops pulling from texts once
+    # "\n".join(parts) is longer than MAX_CHARS: everything after that point
+    # would be cut off by the truncation anyway. parts may already hold
+    # earlier texts. Returns True if the limit was reached.
+    total = sum(len(text) + 1 for text in parts)   # text plus its "\n"
+    if total > MAX_CHARS:
+        return True
+    for text in texts:
+        parts.append(text)
+        total += len(text) + 1
+        if total > MAX_CHARS:
+            return True
+    return False
+
+
+@st.cache_resource(show_spinner=False)
+def _pdf_process_pool() -> ProcessPoolExecutor:
+    # PDFium is not thread-safe, so pages are split across processes (each
+    # opening its own document) rather than threads. The pool is created once
+    # and reused so process start-up is not paid per upload.
+    return ProcessPoolExecutor(
+        max_workers=_PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def _pdfium_page_iter(pdf, start: int, stop: int) -> Iterator[str]:
+    # Lazy, so pages after the MAX_CHARS cut-off are never parsed.
+    for i in range(start, stop):
+        yield pdf[i].get_textpage().get_text_range().replace("\r\n", "\n")
+
+
+def _pdfium_pages(pdf, start: int, stop: int) -> List[str]:
+    parts: List[str] = []
+    _take_until_limit(_pdfium_page_iter(pdf, start, stop), parts)
+    return parts
+
+
+def _pdfium_page_range(bytes_data: bytes, start: int, stop: int) -> List[str]:
+    # Worker entry point: opens the document in the worker process.
+    pdf = pdfium.PdfDocument(bytes_data)
+    try:
+        return _pdfium_pages(pdf, start, stop)
+    finally:
+        pdf.close()
+
+
+def _pdfium_pages_parallel(bytes_data: bytes, start: int, stop: int) -> Iterator[str]:
+    # Yields the texts of pages [start, stop) in order from the worker pool.
+    # Ranges are submitted lazily, at most _PDF_WORKERS at a time, so a
+    # consumer that stops at MAX_CHARS leaves little work behind; ranges still
+    # queued when the generator is closed are cancelled.
+    pool = _pdf_process_pool()
+    starts = iter(range(start, stop, _PDF_CHUNK_PAGES))
+    pending: Deque[Future] = deque()
+
+    def _submit_next() -> None:
+        first = next(starts, None)
+        if first is not None:
+            pending.append(
+                pool.submit(
+                    _pdfium_page_range,
+                    bytes_data,
+                    first,
+                    min(first + _PDF_CHUNK_PAGES, stop),
+                )
+            )
+
+    try:
+        for _ in range(_PDF_WORKERS):
+            _submit_next()
+        while pending:
+            texts = pending.popleft().result()
+            _submit_next()
+            yield from texts
+    finally:
+        for f in pending:
+            f.cancel()
+
+
+def _extract_pdf_pdfium(bytes_data: bytes) -> str:
+    parts: List[str] = []
+    with _PDFIUM_LOCK:
+        try:
+            # PdfDocument reads the bytes object in place; no stream wrapper or copy.
+            pdf = pdfium.PdfDocument(bytes_data)
+        except Exception:
+            return ""
+        try:
+            n_pages = len(pdf)
+            head = n_pages
+            if _PDF_WORKERS >= 2:
+                head = min(n_pages, PARALLEL_PAGE_THRESHOLD)
+            # Most CVs/JDs end or reach MAX_CHARS within the first pages.
+            if _take_until_limit(_pdfium_page_iter(pdf, 0, head), parts) or head == n_pages:
+                return "\n".join(parts)
+        except Exception:
+            return ""
+        finally:
+            pdf.close()
+
+    # Long, text-sparse document: the remaining pages come from the pool.
+    pages = _pdfium_pages_parallel(bytes_data, head, n_pages)
+    try:
+        _take_until_limit(pages, parts)
+    except BrokenProcessPool:
+        # A worker died (PDFium crash, OOM), which leaves the executor broken
+        # for good. Drop it from the cache so the next upload gets a fresh
+        # pool. This document is not retried in-process: whatever killed the
+        # worker would take the server down. The pages read so far are kept.
+        _pdf_process_pool.clear()
+    except Exception:
+        return ""
+    finally:
+        pages.close()
+    return "\n".join(parts)
+
+
 def _extract_pdf(bytes_data: bytes) -> str:
+    if HAS_PDFIUM:
+        return _extract_pdf_pdfium(bytes_data)
     try:
         import PyPDF2
     except Exception:
@@ -45,8 +199,16 @@ def _extract_pdf(bytes_data: bytes) -> str:
         )
         return ""
     try:
+        # A single BytesIO handle over the upload; CPython's BytesIO shares the
+        # initial bytes buffer until written to, so this does not copy.
         reader = PyPDF2.PdfReader(io.BytesIO(bytes_data))
-        return "\n".join(p.extract_text() or "" for p in reader.pages)
+        # Pages are parsed lazily and only until MAX_CHARS is reached; join
+        # then gets a list rather than a generator.
+        parts: List[str] = []
+        _take_until_limit(
+            (page.extract_text() or "" for page in reader.pages), parts
+        )
+        return "\n".join(parts)
     except Exception:
         return ""
 
@@ -55,34 +217,67 @@ def _extract_docx(bytes_data: bytes) -> str:
     if not HAS_DOCX:
         return ""
     try:
-        doc = docx.Document(io.BytesIO(bytes_data))
-        return "\n".join(p.text for p in doc.paragraphs)
+        doc = docx.Document(io.BytesIO(bytes_data))   # shares the buffer, no copy
+        parts: List[str] = []
+        _take_until_limit((p.text for p in doc.paragraphs), parts)
+        return "\n".join(parts)
     except Exception:
         return ""
 
 
-def extract_text(uploaded) -> str:
-    if uploaded is None:
-        return ""
-    try:
-        # Prefer getvalue(); fallback to read() if unavailable
-        data = uploaded.getvalue() if hasattr(uploaded, "getvalue") else uploaded.read()
-    except Exception:
-        return ""
-    name = getattr(uploaded, "name", "").lower()
-    if name.endswith(".pdf"):
+def _extract_bytes(data: bytes, kind: str) -> str:
+    if kind == "pdf":
         return _extract_pdf(data)
-    if name.endswith(".docx") or name.endswith(".doc"):
+    if kind == "docx":
         if not HAS_DOCX:
             st.warning("DOCX support missing. Install: python -m pip install python-docx")
             return ""
         return _extract_docx(data)
     try:
-        return data.decode("utf-8", errors="ignore")
+        # Decode only the prefix that can survive truncation: at most
+        # MAX_CHARS code points of up to 4 UTF-8 bytes each.
+        return data[: MAX_CHARS * 4].decode("utf-8", errors="ignore")[:MAX_CHARS]
+    except Exception:
+        return ""
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _extract_cached(data_hash: str, _data: bytes, kind: str) -> str:
+    # Cached on a BLAKE2b digest of the file bytes + the extraction path.
+    # The leading underscore keeps Streamlit from hashing the raw bytes
+    # again; re-clicking Start with the same upload skips parsing entirely.
+    # Truncated to MAX_CHARS here, so neither the cache nor any downstream
+    # step (blocklist scan, prompt building) ever holds more than that.
+    return _extract_bytes(_data, kind)[:MAX_CHARS]
+
+
+def _detect_kind(data: bytes, name: str) -> str:
+    # Dispatch on the file's magic bytes, so a misnamed binary upload is not
+    # decoded as UTF-8 text. The extension is only a fallback hint.
+    if data[:5] == b"%PDF-":
+        return "pdf"
+    if data[:4] == b"PK\x03\x04":   # ZIP container (DOCX)
+        return "docx"
+    if name.endswith(".pdf"):
+        return "pdf"
+    if name.endswith(".docx") or name.endswith(".doc"):
+        return "docx"
+    return "txt"
+
+
+def extract_text(uploaded) -> str:
+    if uploaded is None:
+        return ""
+    try:
+        # Prefer getvalue(); fallback to read() if unavailable
+        data = uploaded.getvalue() if hasattr(uploaded, "getvalue") else uploaded.read()
     except Exception:
         return ""
+    kind = _detect_kind(data, getattr(uploaded, "name", "").lower())
+    data_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return _extract_cached(data_hash, data, kind)
 
 # ==============================================
 # File text extraction
-# - PDF (PyPDF2), DOCX (python-docx), TXT
+# - PDF (pypdfium2 / PyPDF2), DOCX (python-docx), TXT
 # ==============================================
\ No newline at end of file
@@ -10,7 +10,53 @@ This abstraction decouples application logic from the OpenAI SDK and allows
 the rest of the app to remain provider-agnostic.
 """
 
-from openai import OpenAI
+import logging
+from typing import Iterator, List, Optional
+
+import httpx
+import streamlit as st
+from openai import DefaultHttpxClient, OpenAI
+
+# Module logger only; logging configuration is left to the application.
+logger = logging.getLogger(__name__)
+
+# Connection pool bounds for the shared client. The cached client is used by
+# every session of the Streamlit server, so idle keep-alive connections are
+# retained generously while the total stays capped.
+HTTP_LIMITS = httpx.Limits(max_connections=1024, max_keepalive_connections=256)
+
+
+@st.cache_resource(show_spinner=False)
+def get_client(api_key: str) -> OpenAI:
+    """Return a shared OpenAI client for the given API key.
+
+    Cached across Streamlit reruns so the underlying HTTP connection pool
+    (and its TLS sessions) is reused instead of rebuilt on every call.
+
+    Args:
+        api_key: OpenAI API key.
+
+    Returns:
+        OpenAI client instance.
+    """
+    # DefaultHttpxClient keeps the SDK's own timeout/redirect defaults.
+    return OpenAI(
+        api_key=api_key,
+        http_client=DefaultHttpxClient(limits=HTTP_LIMITS),
+    )
+
+
+def _extra_kwargs(force_json: bool, prompt_cache_key: Optional[str]) -> dict:
+    """Optional chat completion arguments shared by all call variants."""
+    kwargs = {}
+    if force_json:
+        # Requires a model that supports JSON mode (e.g., gpt-4o, gpt-4o-mini).
+        kwargs["response_format"] = {"type": "json_object"}
+    if prompt_cache_key:
+        # Sent via extra_body so older SDK versions without the named
+        # parameter still forward it.
+        kwargs["extra_body"] = {"prompt_cache_key": prompt_cache_key}
+    return kwargs
 
 
 def call_openai(
@@ -24,6 +70,7 @@ def call_openai(
     frequency_penalty: float,
     presence_penalty: float,
     force_json: bool = False,
+    prompt_cache_key: Optional[str] = None,
 ) -> str:
     """Call OpenAI chat completions and return the assistant content.
 
@@ -38,16 +85,15 @@ def call_openai(
         frequency_penalty: Frequency penalty.
         presence_penalty: Presence penalty.
         force_json: If True, request JSON output format.
+        prompt_cache_key: Optional key that routes requests sharing the same
+            prompt prefix to the same prompt cache.
 
     Returns:
         Assistant message content as a string.
     """
-    client = OpenAI(api_key=api_key)
-
-    kwargs = {}
-    if force_json:
-        # Requires a model that supports JSON mode (e.g., gpt-4o, gpt-4o-mini).
-        kwargs["response_format"] = {"type": "json_object"}
+    client = get_client(api_key)
+    kwargs = _extra_kwargs(force_json, prompt_cache_key)
+    logger.info("[OpenAI] model=%s force_json=%s", model, force_json)
 
     completion = client.chat.completions.create(
         model=model,
@@ -63,3 +109,63 @@ def call_openai(
         **kwargs,
     )
     return completion.choices[0].message.content
+
+
+def stream_openai(
+    api_key: str,
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    top_p: float,
+    frequency_penalty: float,
+    presence_penalty: float,
+    force_json: bool = False,
+    prompt_cache_key: Optional[str] = None,
+) -> Iterator[str]:
+    """Call OpenAI chat completions with streaming and yield content deltas.
+
+    Takes the same arguments as call_openai. The request is sent when the
+    iteration starts.
+
+    Yields:
+        Assistant content chunks as they arrive.
+    """
+    client = get_client(api_key)
+    kwargs = _extra_kwargs(force_json, prompt_cache_key)
+    logger.info("[OpenAI] model=%s force_json=%s", model, force_json)
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        presence_penalty=presence_penalty,
+        stream=True,
+        **kwargs,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def embed_texts(api_key: str, model: str, inputs: List[str]) -> List[List[float]]:
+    """Embed a batch of texts with a single embeddings request.
+
+    Args:
+        api_key: OpenAI API key.
+        model: Embedding model name.
+        inputs: Texts to embed.
+
+    Returns:
+        One embedding vector per input, in input order.
+    """
+    client = get_client(api_key)
+    response = client.embeddings.create(model=model, input=inputs)
+    return [item.embedding for item in response.data]
@@ -0,0 +1,123 @@
+"""
+CV/JD fragment retrieval.
+
+Splits the CV and Job Description into small fragments once per chat
+session, embeds them, and selects the fragments most relevant to a user
+message so follow-up turns only send those fragments instead of the full
+documents.
+
+Design notes:
+- Fragments are embedded once and cached across reruns/sessions by content
+- Similarity is a single matrix-vector product over normalized vectors
+- Selected fragments are returned in document order
+"""
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+import streamlit as st
+
+from config import EMBEDDING_MODEL
+from openai_client import embed_texts
+
+# Roughly 200 tokens per fragment (~4 characters per token)
+FRAGMENT_CHARS = 800
+
+
+@dataclass(frozen=True)
+class FragmentIndex:
+    """Embedded CV/JD fragments for one chat session."""
+    fragments: Tuple[str, ...]
+    is_cv: np.ndarray   # bool mask: True for CV fragments, False for JD fragments
+    vectors: np.ndarray  # float32, shape (n_fragments, dim), L2-normalized rows
+
+
+def split_fragments(text: str, max_chars: int = FRAGMENT_CHARS) -> List[str]:
+    """Split text into fragments of at most max_chars, packing whole lines."""
+    fragments: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # Hard-split lines that are longer than a fragment on their own,
+        # after flushing the pending lines so fragments stay in document order
+        if len(line) > max_chars and current:
+            fragments.append("\n".join(current))
+            current, size = [], 0
+        while len(line) > max_chars:
+            fragments.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) + 1 > max_chars and current:
+            fragments.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        fragments.append("\n".join(current))
+    return fragments
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def build_fragment_index(_api_key: str, cv_text: str, jd_text: str) -> FragmentIndex:
+    """Split and embed CV/JD fragments with one embeddings request.
+
+    Cached by CV/JD content, so restarting the chat with the same files does
+    not embed them again. The API key is excluded from the cache key; the
+    number of cached indexes is bounded so server memory stays flat.
+    """
+    cv_fragments = split_fragments(cv_text)
+    jd_fragments = split_fragments(jd_text)
+    fragments = tuple(cv_fragments + jd_fragments)
+    vectors = np.asarray(
+        embed_texts(_api_key, EMBEDDING_MODEL, list(fragments)), dtype=np.float32
+    )
+    is_cv = np.zeros(len(fragments), dtype=bool)
+    is_cv[: len(cv_fragments)] = True
+    return FragmentIndex(fragments=fragments, is_cv=is_cv, vectors=_normalize(vectors))
+
+
+def retrieve_context(
+    api_key: str, index: FragmentIndex, query: str, top_k: int
+) -> Tuple[str, str]:
+    """Select the top_k fragments most similar to the query.
+
+    The best-matching fragment of each document is always kept, so neither
+    excerpt comes back empty while its document has text.
+
+    Args:
+        api_key: OpenAI API key.
+        index: Fragment index built for the session.
+        query: User message to match against.
+        top_k: Number of fragments to keep (at least one per document).
+
+    Returns:
+        Tuple of (cv_excerpt, jd_excerpt) built from the selected fragments.
+    """
+    q = np.asarray(embed_texts(api_key, EMBEDDING_MODEL, [query])[0], dtype=np.float32)
+    scores = index.vectors @ _normalize(q)
+    if top_k >= len(scores):
+        top = np.arange(len(scores))
+    else:
+        # Reserve the best fragment of each document, then fill up by score
+        reserved = [
+            int(np.argmax(np.where(mask, scores, -np.inf)))
+            for mask in (index.is_cv, ~index.is_cv)
+            if mask.any()
+        ]
+        rest = scores.copy()
+        rest[reserved] = -np.inf
+        n_rest = max(top_k - len(reserved), 0)
+        best_rest = np.argpartition(-rest, max(n_rest - 1, 0))[:n_rest]
+        top = np.concatenate([np.asarray(reserved, dtype=best_rest.dtype), best_rest])
+        top.sort()  # keep document order
+    cv_parts = [index.fragments[i] for i in top if index.is_cv[i]]
+    jd_parts = [index.fragments[i] for i in top if not index.is_cv[i]]
+    return "\n...\n".join(cv_parts), "\n...\n".join(jd_parts)
@@ -1,5 +1,17 @@
+import functools
 import re   # Regular expressions to detect known prompt injection patterns in the text.
 
+# Optional Hyperscan support
+# Compiles all blocklist patterns into one multi-pattern DFA that scans the
+# text in a single linear pass. If the library is not installed, the
+# precompiled regex fallback below is used instead.
+try:
+    import hyperscan
+    HAS_HYPERSCAN = True
+except Exception:
+    hyperscan = None
+    HAS_HYPERSCAN = False
+
 # ==============================================
 # Security and limits
 # - MAX_CHARS cap and simple blocklist checks
@@ -15,15 +27,69 @@ BLOCKLIST_PATTERNS = [
     r"do anything",
 ]
 
+# Compiled once at import into a single alternation, so the fallback scan is
+# one pass over the text instead of one pass per pattern.
+_BLOCKLIST_RE = re.compile(
+    "|".join(f"(?:{p})" for p in BLOCKLIST_PATTERNS), flags=re.IGNORECASE
+)
+
+
+def _compile_hyperscan_db():
+    if not HAS_HYPERSCAN:
+        return None
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.encode("utf-8") for p in BLOCKLIST_PATTERNS],
+            ids=list(range(len(BLOCKLIST_PATTERNS))),
+            elements=len(BLOCKLIST_PATTERNS),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH]
+            * len(BLOCKLIST_PATTERNS),
+        )
+        return db
+    except Exception:
+        return None
+
+
+_HS_DB = _compile_hyperscan_db()
+
+
+def _on_hs_match(pattern_id, start, end, flags, hits):
+    hits.append(pattern_id)
+    return True   # stop scanning at the first hit
+
+
+# Single scan over the text; results are memoized because chat messages
+# repeat often ("continue", "why?") and the same CV/JD is re-checked when
+# the chat is restarted.
+@functools.lru_cache(maxsize=256)
+def _scan_blocklist(text: str) -> bool:
+    if _HS_DB is not None:
+        hits = []
+        try:
+            _HS_DB.scan(
+                text.encode("utf-8", errors="ignore"),
+                match_event_handler=_on_hs_match,
+                context=hits,
+            )
+            return bool(hits)
+        except Exception:
+            if hits:
+                return True
+            # Fall through to the regex scan if Hyperscan fails unexpectedly.
+    return _BLOCKLIST_RE.search(text) is not None
+
+
 # Basic guardrail: checks user-provided text for known prompt-injection patterns
 # and blocks it before sending any content to the LLM.
 def matches_blocklist(text: str) -> bool:
     if not text:
         return False
-    for p in BLOCKLIST_PATTERNS:
-        if re.search(p, text, flags=re.IGNORECASE):
-            return True
-    return False
+    return _scan_blocklist(text)
 
 # Input length limit from CV/JD uploads to avoid excessive token usage.
-MAX_CHARS = 15000
\ No newline at end of file
+MAX_CHARS = 15000
+
+# Upload size limit; larger files are rejected before any parsing.
+# Keep in sync with server.maxUploadSize (MB) in .streamlit/config.toml.
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
@@ -7,12 +7,12 @@ Responsibilities:
 """
 
 from dataclasses import dataclass
-from typing import Literal
+from typing import Iterable, Literal, Optional, Tuple, Union
 
 import json
 import streamlit as st
 
-OutputFormat = Literal["Text", "JSON_A", "JSON_B"]
+OutputFormat = Literal["Text", "JSON_A", "JSON_B", "JSON_AB"]
 
 
 @dataclass   # Python decorator that automatically creates simple data container for sidebar values (no logic or computation)
@@ -56,7 +56,7 @@ def render_sidebar(allowed_models: list[str], default_model: str) -> UiSettings:
     )
 
     output_format: OutputFormat = st.sidebar.selectbox(
-        "Output format", ["Text", "JSON_A", "JSON_B"], index=0
+        "Output format", ["Text", "JSON_A", "JSON_B", "JSON_AB"], index=0
     )
 
     return UiSettings(
@@ -84,21 +84,105 @@ def render_upload_section():
     return cv_file, jd_file
 
 
-def render_assistant_output(text: str, output_format: OutputFormat) -> None:
+def _find_json_span(text: str, pos: int = 0) -> Optional[Tuple[int, int]]:
+    """Locate the first bracketed JSON object/array candidate in text[pos:].
+
+    Single forward scan: skips string literals (with escapes) and tracks
+    {}/[] depth, stopping as soon as the first value closes. Used to recover
+    JSON wrapped in code fences or surrounding commentary.
+
+    Returns:
+        (start, end) slice bounds of the candidate, or None if text[pos:] has
+        no opening bracket or the first candidate never closes (a reply cut
+        off by max_tokens).
+    """
+    start = -1
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(pos, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif start < 0:
+            if ch in "{[":
+                start, depth = i, 1
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return start, i + 1
+    return None
+
+
+def _parse_json(text: str):
+    """Parse a JSON response, falling back to the first embedded JSON object.
+
+    Only complete top-level candidates are tried, each scanned once: one that
+    is not a JSON object (e.g. a bracketed "[note]" in commentary) is skipped
+    and the scan continues after it. Truncated JSON is never salvaged from
+    its inner values; the original parse error is raised instead.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as exc:
+        error = exc
+    pos = 0
+    while True:
+        span = _find_json_span(text, pos)
+        if span is None:
+            raise error
+        start, end = span
+        try:
+            value = json.loads(text[start:end])
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict):
+            return value
+        pos = end
+
+
+def render_assistant_output(
+    text: Union[str, Iterable[str]], output_format: OutputFormat
+) -> str:
     """Render assistant output based on the chosen output format.
 
     Args:
-        text: Assistant response as a string.
-        output_format: "Text" | "JSON_A" | "JSON_B".
+        text: Assistant response as a string, or an iterable of streamed text
+            chunks. Streamed text is written as it arrives; streamed JSON is
+            collected and parsed once complete.
+        output_format: "Text" | "JSON_A" | "JSON_B" | "JSON_AB".
 
     Returns:
-        None. Renders content to the Streamlit app.
+        The full response text. Renders content to the Streamlit app.
     """
+    if not isinstance(text, str):
+        if not output_format.startswith("JSON"):
+            return st.write_stream(text)
+        text = "".join(text)
     if output_format.startswith("JSON"):
         try:
-            st.json(json.loads(text))
+            data = _parse_json(text)
+            if output_format == "JSON_AB" and isinstance(data, dict):
+                # Combined response: show Task A and Task B in separate panels
+                tab_a, tab_b = st.tabs(["Summary, matches & gaps", "Interview questions"])
+                with tab_a:
+                    st.json({k: v for k, v in data.items() if k != "questions"})
+                with tab_b:
+                    st.json({"questions": data.get("questions", [])})
+            else:
+                st.json(data)
         except json.JSONDecodeError:
             st.error("Invalid JSON returned. Showing raw response:")
             st.text(text)
     else:
         st.markdown(text)
+    return text